@@ -5,6 +5,7 @@ A recursive note-taking app that updates a single Markdown file in real-time.
 JourneyHacks 2026 | Team: Prajwal & Eric
 """
 
+import os
 import logging
 from flask import Flask
 from flask_cors import CORS
@@ -18,7 +19,7 @@ from config import (
 )
 from routes import api
 from services.markdown import ensure_notes_file
-from services.vectordb import sync_chromadb_with_file
+from services.vectordb import schedule_sync
 from services.queue_processor import start_queue_worker
 
 
@@ -33,21 +34,33 @@ def create_app():
     return app
 
 
-# Create the app instance
+def start_background_services():
+    """
+    Start the serving process's background work. Called once by the process
+    that serves requests (the __main__ block, or gunicorn's post_worker_init hook),
+    never on import, so worker or helper processes don't each start their own.
+    """
+    # Initialize default project (indexed in the background)
+    ensure_notes_file(DEFAULT_PROJECT_NAME)
+    schedule_sync(DEFAULT_PROJECT_NAME)
+    
+    # Start the FIFO queue processor
+    start_queue_worker()
+
+
+# Create the app instance (also the WSGI entry point: `gunicorn app:app`,
+# whose background services start from gunicorn.conf.py)
 app = create_app()
 
 
 if __name__ == '__main__':
-    import os
+    # Development server only; production runs gunicorn with gunicorn.conf.py,
+    # whose post_worker_init hook calls start_background_services()
     port = int(os.getenv("PORT", 5050))
+    debug = os.getenv("FLASK_DEBUG", "0") == "1"
     default_project = DEFAULT_PROJECT_NAME
     
-    # Initialize default project
-    ensure_notes_file(default_project)
-    sync_chromadb_with_file(default_project)
-    
-    # Start the FIFO queue processor
-    start_queue_worker()
+    start_background_services()
     
     log_event(
         logging.INFO,
@@ -72,4 +85,5 @@ if __name__ == '__main__':
     ╚═══════════════════════════════════════════════════╝
     """)
     
-    app.run(debug=True, port=port, threaded=True)
+    # No reloader: its child process would run this block again
+    app.run(debug=debug, port=port, threaded=True, use_reloader=False)
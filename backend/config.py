@@ -5,11 +5,11 @@ Configuration, constants, and service initialization.
 import os
 import re
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
 from dotenv import load_dotenv
-import chromadb
 import google.generativeai as genai
 
 # --- LOAD ENV ---
@@ -37,9 +37,14 @@ def log_event(level: int, message: str, **data):
 PROJECTS_DIR = Path(__file__).parent / "projects"
 PROJECTS_DIR.mkdir(exist_ok=True)
 
+# Persisted section indexes (int8 vector file + JSON sidecar per project)
+INDEX_DIR = PROJECTS_DIR / ".index"
+INDEX_DIR.mkdir(exist_ok=True)
+
 # --- CONSTANTS ---
 SIMILARITY_THRESHOLD = 0.61
 DEFAULT_PROJECT_NAME = "Latent Loop"
+SSE_HEARTBEAT_SECONDS = 15.0  # Idle keep-alive interval per SSE client
 
 # --- API KEYS ---
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -59,20 +64,33 @@ if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
     gemini_model = genai.GenerativeModel('gemini-3-flash-preview') # old: gemini-2.5-flash
 
-# ChromaDB client
-chroma_client = chromadb.Client()
-
 # FastEmbed for local embeddings
 from fastembed import TextEmbedding
-embed_model = TextEmbedding(model_name="BAAI/bge-small-en-v1.5")
+# fastembed's bge-small entry already resolves to Qdrant's quantized ONNX export;
+# any other fastembed model can be swapped in via EMBED_MODEL
+EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-small-en-v1.5")
+# ONNX Runtime intra-op threads (defaults to every available core)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0")) or os.cpu_count()
+embed_model = TextEmbedding(
+    model_name=EMBED_MODEL,
+    threads=EMBED_THREADS,
+    providers=["CPUExecutionProvider"],
+)
+
+# Pre-warm the ONNX session so the first transcript doesn't pay for model setup
+next(iter(embed_model.embed(["warmup"])))
 
 
 # --- PROJECT HELPERS ---
 
+_SLUG_SEPARATOR_RE = re.compile(r"[^a-z0-9]+")
+
+
+@lru_cache(maxsize=128)
 def slugify_project(name: str) -> str:
     """Convert project name to URL-safe slug."""
     cleaned = name.strip().lower() if name else DEFAULT_PROJECT_NAME.lower()
-    cleaned = re.sub(r"[^a-z0-9]+", "-", cleaned).strip("-")
+    cleaned = _SLUG_SEPARATOR_RE.sub("-", cleaned).strip("-")
     return cleaned or "default"
 
 
@@ -81,6 +99,7 @@ def resolve_project_name(value: Optional[str]) -> str:
     return value.strip() if value and value.strip() else DEFAULT_PROJECT_NAME
 
 
+@lru_cache(maxsize=128)
 def get_project_path(project_name: str) -> Path:
     """Get the file path for a project's notes."""
     slug = slugify_project(project_name)
@@ -0,0 +1,15 @@
+"""
+Gunicorn settings for Latent Loop (picked up automatically from this directory).
+One process: pending updates and SSE clients live in memory.
+"""
+
+bind = "0.0.0.0:5050"
+workers = 1
+worker_class = "gthread"
+threads = 64
+
+
+def post_worker_init(worker):
+    """Start the queue worker and initial sync once the worker has loaded the app."""
+    from app import start_background_services
+    start_background_services()
@@ -2,11 +2,18 @@
 Data structures (dataclasses) for Latent Loop.
 """
 
-from dataclasses import dataclass
-from typing import Optional
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Event
+from typing import Any, Deque, Dict, List, Optional
 
+import numpy as np
 
-@dataclass
+# Frames buffered per SSE client before the oldest are dropped
+CLIENT_BUFFER_SIZE: int = 256
+
+
+@dataclass(slots=True)
 class MarkdownSection:
     """Represents a section in the markdown file."""
     id: str
@@ -15,9 +22,20 @@ class MarkdownSection:
     content: str  # Full content including heading
     line_start: int
     line_end: int
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict of the fields (a flat, faster dataclasses.asdict)."""
+        return {
+            "id": self.id,
+            "heading": self.heading,
+            "level": self.level,
+            "content": self.content,
+            "line_start": self.line_start,
+            "line_end": self.line_end,
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class PendingUpdate:
     """Represents an ambiguous update awaiting user confirmation."""
     id: str
@@ -27,3 +45,59 @@ class PendingUpdate:
     suggested_action: str  # "update", "create", "delete"
     reason: str
     timestamp: str
+    matched_section_id: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict of the fields (a flat, faster dataclasses.asdict)."""
+        return {
+            "id": self.id,
+            "transcript": self.transcript,
+            "matched_section": self.matched_section,
+            "similarity": self.similarity,
+            "suggested_action": self.suggested_action,
+            "reason": self.reason,
+            "timestamp": self.timestamp,
+            "matched_section_id": self.matched_section_id,
+        }
+
+
+@dataclass(slots=True)
+class SectionIndex:
+    """A project's searchable sections, one int8-quantized unit vector per row."""
+    generation: int  # Notes generation the index was built from
+    ids: List[str]
+    headings: List[str]
+    hashes: List[str]  # Hash of each section's embedded text (equal text, equal vector)
+    vectors: np.ndarray  # (sections, dim) int8; row i * scales[i] ~= the unit embedding
+    scales: np.ndarray  # (sections,) float32
+
+
+@dataclass(slots=True, eq=False)
+class ClientChannel:
+    """
+    Event buffer for one connected SSE client.
+    Broadcasters push without locking (deque appends are atomic); the client's
+    stream is the only consumer.
+    """
+    frames: Deque[bytes] = field(default_factory=lambda: deque(maxlen=CLIENT_BUFFER_SIZE))
+    ready: Event = field(default_factory=Event)
+    
+    def push(self, frame: bytes) -> bool:
+        """
+        Buffer an encoded frame and wake the client's stream. Never blocks: a
+        full buffer drops its oldest frame, and False is returned.
+        """
+        overflowed = len(self.frames) == CLIENT_BUFFER_SIZE
+        self.frames.append(frame)
+        self.ready.set()
+        return not overflowed
+    
+    def wait(self, timeout: float) -> List[bytes]:
+        """Block until frames arrive (or timeout) and take everything buffered."""
+        self.ready.wait(timeout)
+        # Clear before draining so a push that lands mid-drain re-arms the event
+        self.ready.clear()
+        frames = []
+        while self.frames:
+            frames.append(self.frames.popleft())
+        return frames
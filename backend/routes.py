@@ -2,12 +2,10 @@
 Flask routes for Latent Loop API.
 """
 
-import json
-import queue
 import logging
-from dataclasses import asdict
 
-from flask import Blueprint, Response, request, jsonify, stream_with_context, render_template
+import orjson
+from flask import Blueprint, Response, request, stream_with_context, render_template
 
 from config import (
     log_event,
@@ -16,24 +14,40 @@ from config import (
     slugify_project,
     groq_client,
     gemini_model,
+    SSE_HEARTBEAT_SECONDS,
 )
-from state import TRANSCRIPT_LOGS, PENDING_UPDATES, CONNECTED_CLIENTS
+from state import TRANSCRIPT_LOGS, NOTES_LOCKS, recent_entries
 from services.markdown import (
     initial_content,
     ensure_notes_file,
     read_notes_file,
     write_notes_file,
-    parse_markdown_sections,
+    parse_section_dicts,
 )
-from services.vectordb import sync_chromadb_with_file
+from services.vectordb import schedule_sync
 from services.ai import transcribe_audio
-from services.processing import process_transcript, resolve_pending_update, broadcast_event
+from services.processing import (
+    process_transcript,
+    resolve_pending_update,
+    broadcast_event,
+    sse_frame,
+    HEARTBEAT_FRAME,
+    register_client,
+    unregister_client,
+    list_pending,
+    clear_pending,
+)
 from services.queue_processor import enqueue_transcript, get_result
 
 # Create blueprint
 api = Blueprint('api', __name__)
 
 
+def json_response(payload) -> Response:
+    """JSON response encoded with orjson (drop-in for jsonify)."""
+    return Response(orjson.dumps(payload), mimetype="application/json")
+
+
 # --- PAGE ROUTES ---
 
 @api.route('/')
@@ -41,7 +55,7 @@ def index():
     """Serve the main interface."""
     project = resolve_project_name(request.args.get("project"))
     ensure_notes_file(project)
-    sync_chromadb_with_file(project)
+    schedule_sync(project)
     return render_template('index.html')
 
 
@@ -49,12 +63,12 @@ def index():
 def health():
     """Health check endpoint."""
     project = resolve_project_name(request.args.get("project"))
-    return jsonify({
+    return json_response({
         "status": "ok",
         "groq_available": groq_client is not None,
         "gemini_available": gemini_model is not None,
         "notes_file": str(get_project_path(project)),
-        "pending_updates": len(PENDING_UPDATES[project])
+        "pending_updates": len(list_pending(project))
     })
 
 
@@ -66,17 +80,17 @@ def get_notes():
     project = resolve_project_name(request.args.get("project"))
     try:
         content = read_notes_file(project)
-        sections = parse_markdown_sections(content)
         
-        return jsonify({
+        payload = {
             "content": content,
-            "sections": [asdict(s) for s in sections],
-            "pending_updates": [asdict(p) for p in PENDING_UPDATES[project]],
+            "sections": parse_section_dicts(content),
+            "pending_updates": [p.to_dict() for p in list_pending(project)],
             "project": project
-        })
+        }
+        return json_response(payload)
     except Exception as e:
         log_event(logging.ERROR, "api_notes_error", error=str(e))
-        return jsonify({
+        return json_response({
             "content": initial_content(project),
             "sections": [],
             "pending_updates": []
@@ -87,7 +101,7 @@ def get_notes():
 def get_transcript():
     """Get recent transcript log."""
     project = resolve_project_name(request.args.get("project"))
-    return jsonify({"transcript": TRANSCRIPT_LOGS[project][-10:], "project": project})
+    return json_response({"transcript": recent_entries(TRANSCRIPT_LOGS[project], 10), "project": project})
 
 
 @api.route('/api/process', methods=['POST'])
@@ -98,36 +112,35 @@ def process_text():
     project = resolve_project_name(data.get('project'))
     
     if not text:
-        return jsonify({"error": "No text provided"}), 400
+        return json_response({"error": "No text provided"}), 400
     log_event(logging.INFO, "api_process_text", chars=len(text))
     
     result = process_transcript(text, project)
     result["project"] = project
-    return jsonify(result)
+    return json_response(result)
 
 
 @api.route('/api/audio', methods=['POST'])
 def process_audio():
     """Process audio input - transcribes then enqueues for FIFO processing."""
     if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
+        return json_response({"error": "No audio file provided"}), 400
     
     audio_file = request.files['audio']
-    audio_data = audio_file.read()
     project = resolve_project_name(request.args.get('project'))
     chunk_num = request.args.get('chunk', type=int)
-    log_event(logging.INFO, "api_process_audio", bytes=len(audio_data), chunk_num=chunk_num)
+    log_event(logging.INFO, "api_process_audio", bytes=request.content_length, chunk_num=chunk_num)
     
-    # Transcribe immediately
-    text = transcribe_audio(audio_data)
+    # Transcribe immediately, streaming the upload straight to Groq
+    text = transcribe_audio(audio_file.stream)
     
     if not text:
-        return jsonify({"error": "Could not transcribe audio"}), 400
+        return json_response({"error": "Could not transcribe audio"}), 400
     
     # Enqueue for FIFO processing
     request_id = enqueue_transcript(text, project, chunk_num)
     
-    return jsonify({
+    return json_response({
         "status": "queued",
         "request_id": request_id,
         "transcription": text,
@@ -141,8 +154,8 @@ def queue_status(request_id):
     """Check the status of a queued processing request."""
     result = get_result(request_id)
     if result is None:
-        return jsonify({"error": "Request not found"}), 404
-    return jsonify(result)
+        return json_response({"error": "Request not found"}), 404
+    return json_response(result)
 
 
 @api.route('/api/pending/<pending_id>', methods=['POST'])
@@ -154,15 +167,15 @@ def handle_pending(pending_id):
     log_event(logging.INFO, "api_handle_pending", pending_id=pending_id, action=action, project=project)
     
     result = resolve_pending_update(pending_id, action, project)
-    return jsonify(result)
+    return json_response(result)
 
 
 @api.route('/api/pending', methods=['GET'])
 def get_pending():
     """Get all pending updates."""
     project = resolve_project_name(request.args.get('project'))
-    return jsonify({
-        "pending": [asdict(p) for p in PENDING_UPDATES[project]],
+    return json_response({
+        "pending": [p.to_dict() for p in list_pending(project)],
         "project": project
     })
 
@@ -171,40 +184,36 @@ def get_pending():
 def stream():
     """SSE endpoint for real-time updates."""
     project = resolve_project_name(request.args.get('project'))
-    client_queue = queue.Queue()
-    CONNECTED_CLIENTS[project].append(client_queue)
+    channel = register_client(project)
     
     def event_stream():
         # Send initial state
         try:
             content = read_notes_file(project)
-            sections = parse_markdown_sections(content)
             
             init_data = {
                 'type': 'init',
                 'content': content,
-                'sections': [asdict(s) for s in sections],
-                'transcript': TRANSCRIPT_LOGS[project][-5:],
-                'pending': [asdict(p) for p in PENDING_UPDATES[project]],
+                'sections': parse_section_dicts(content),
+                'transcript': recent_entries(TRANSCRIPT_LOGS[project], 5),
+                'pending': [p.to_dict() for p in list_pending(project)],
                 'project': project
             }
-            yield f"data: {json.dumps(init_data)}\n\n"
+            yield sse_frame(init_data)
         except Exception as e:
             log_event(logging.ERROR, "sse_init_error", error=str(e))
-            yield f"data: {json.dumps({'type': 'init', 'content': initial_content(project), 'sections': [], 'transcript': [], 'pending': [], 'project': project})}\n\n"
+            yield sse_frame({'type': 'init', 'content': initial_content(project), 'sections': [], 'transcript': [], 'pending': [], 'project': project})
         
         try:
             while True:
-                try:
-                    data = client_queue.get(timeout=2.0)
-                    yield f"data: {json.dumps(data)}\n\n"
-                except queue.Empty:
-                    yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+                # Frames arrive already encoded by broadcast_event; anything
+                # buffered since the last wakeup goes out as one chunk
+                frames = channel.wait(SSE_HEARTBEAT_SECONDS)
+                yield b"".join(frames) if frames else HEARTBEAT_FRAME
         except GeneratorExit:
             pass
         finally:
-            if client_queue in CONNECTED_CLIENTS[project]:
-                CONNECTED_CLIENTS[project].remove(client_queue)
+            unregister_client(project, channel)
     
     return Response(
         stream_with_context(event_stream()),
@@ -222,20 +231,21 @@ def clear_notes():
     """Reset notes.md to initial state."""
     project = resolve_project_name(request.args.get('project'))
     content = initial_content(project)
-    write_notes_file(project, content)
-    sync_chromadb_with_file(project)
-    log_event(logging.INFO, "notes_cleared", project=project)
-    
-    PENDING_UPDATES[project].clear()
-    TRANSCRIPT_LOGS[project].clear()
-    
-    broadcast_event(project, {
-        "type": "file_updated",
-        "content": content,
-        "change_info": {"action": "clear"}
-    })
+    with NOTES_LOCKS[project]:
+        write_notes_file(project, content)
+        log_event(logging.INFO, "notes_cleared", project=project)
+        
+        clear_pending(project)
+        TRANSCRIPT_LOGS[project].clear()
+        
+        broadcast_event(project, {
+            "type": "file_updated",
+            "content": content,
+            "change_info": {"action": "clear"}
+        })
+    schedule_sync(project)
     
-    return jsonify({"status": "cleared", "project": project})
+    return json_response({"status": "cleared", "project": project})
 
 
 @api.route('/api/export')
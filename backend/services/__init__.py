@@ -6,12 +6,14 @@ from services.markdown import (
     read_notes_file,
     write_notes_file,
     parse_markdown_sections,
+    parse_section_dicts,
 )
 
 from services.vectordb import (
     get_embedding,
-    get_collection,
-    sync_chromadb_with_file,
+    get_embeddings,
+    sync_section_index,
+    schedule_sync,
     find_relevant_section,
 )
 
@@ -25,6 +27,11 @@ from services.processing import (
     process_transcript,
     resolve_pending_update,
     broadcast_event,
+    sse_frame,
+    register_client,
+    unregister_client,
+    list_pending,
+    clear_pending,
 )
 
 __all__ = [
@@ -34,10 +41,12 @@ __all__ = [
     "read_notes_file",
     "write_notes_file",
     "parse_markdown_sections",
+    "parse_section_dicts",
     # VectorDB
     "get_embedding",
-    "get_collection",
-    "sync_chromadb_with_file",
+    "get_embeddings",
+    "sync_section_index",
+    "schedule_sync",
     "find_relevant_section",
     # AI
     "transcribe_audio",
@@ -47,4 +56,9 @@ __all__ = [
     "process_transcript",
     "resolve_pending_update",
     "broadcast_event",
+    "sse_frame",
+    "register_client",
+    "unregister_client",
+    "list_pending",
+    "clear_pending",
 ]
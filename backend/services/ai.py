@@ -2,56 +2,79 @@
 AI operations: Gemini synthesis and Groq Whisper transcription.
 """
 
-import io
 import re
 import logging
-from typing import Optional, Tuple, Dict
+from typing import BinaryIO, Callable, Optional, Tuple, Dict
+
+import numpy as np
 
 from config import log_event, gemini_model, groq_client
+from services.markdown import parse_markdown_sections
+
+# Level-2 headings in Gemini output (compiled once; used on every create)
+_H2_HEADING_RE = re.compile(r'^##\s+(.+)$', re.MULTILINE)
+
+# Leading ``` / ```markdown and trailing ``` fences around Gemini output
+_CODE_FENCE_RE = re.compile(r'\A\s*```(?:markdown)?|```\s*\Z')
 
 
 # --- INTENT DETECTION ---
 
+# Patterns that suggest uncertainty or correction-in-progress (each implicitly
+# starts at a word boundary)
+AMBIGUOUS_PATTERNS = [
+    (r'wait\b.*\bno\b', "User said 'wait, no' - unclear if deleting or pausing"),
+    (r'actually\b.*\bwait\b', "User said 'actually wait' - intent unclear"),
+    (r'hmm+\b', "User is thinking/hesitating"),
+    (r'uh+\b.*\blet me\b', "User is reconsidering"),
+    (r'scratch that\b(?!\s*,)', "User wants to undo but scope unclear"),
+    (r'nevermind\b', "User cancelled but unclear what"),
+    (r'forget\s+(what\s+)?i\s+said\b', "User wants to forget but scope unclear"),
+]
+
+# All patterns as one alternation behind a shared word boundary, so a transcript
+# is scanned once; the named group that matched identifies the pattern
+_AMBIGUOUS_RE = re.compile(
+    r'\b(?:' + '|'.join(f'(?P<p{i}>{pattern})' for i, (pattern, _) in enumerate(AMBIGUOUS_PATTERNS)) + ')'
+)
+
+# Literal substrings at least one of which every pattern above requires; most
+# transcripts contain none of them and skip the regex entirely
+_AMBIGUOUS_KEYWORDS = ('wait', 'hmm', 'uh', 'scratch that', 'nevermind', 'forget')
+
+
 def detect_ambiguous_intent(text: str) -> Tuple[bool, str]:
     """
     Detect if the user's intent is ambiguous.
-    Returns (is_ambiguous, reason).
+    Returns (is_ambiguous, reason) for the earliest ambiguous phrase.
     """
-    # Patterns that suggest uncertainty or correction-in-progress
-    ambiguous_patterns = [
-        (r'\bwait\b.*\bno\b', "User said 'wait, no' - unclear if deleting or pausing"),
-        (r'\bactually\b.*\bwait\b', "User said 'actually wait' - intent unclear"),
-        (r'\bhmm+\b', "User is thinking/hesitating"),
-        (r'\buh+\b.*\blet me\b', "User is reconsidering"),
-        (r'\bscratch that\b(?!\s*,)', "User wants to undo but scope unclear"),
-        (r'\bnevermind\b', "User cancelled but unclear what"),
-        (r'\bforget\s+(what\s+)?i\s+said\b', "User wants to forget but scope unclear"),
-    ]
-    
-    text_lower = text.lower()
+    text = text.lower()
+    if not any(keyword in text for keyword in _AMBIGUOUS_KEYWORDS):
+        return False, ""
     
-    for pattern, reason in ambiguous_patterns:
-        if re.search(pattern, text_lower):
-            log_event(logging.INFO, "ambiguous_intent_detected", pattern=pattern, reason=reason)
-            return True, reason
+    match = _AMBIGUOUS_RE.search(text)
+    if match:
+        pattern, reason = AMBIGUOUS_PATTERNS[int(match.lastgroup[1:])]
+        log_event(logging.INFO, "ambiguous_intent_detected", pattern=pattern, reason=reason)
+        return True, reason
     
     return False, ""
 
 
 # --- AUDIO TRANSCRIPTION ---
 
-def transcribe_audio(audio_data: bytes) -> str:
-    """Transcribe audio using Groq's Whisper API."""
+def transcribe_audio(audio_stream: BinaryIO, filename: str = "audio.wav") -> str:
+    """
+    Transcribe audio using Groq's Whisper API.
+    The stream (e.g. an uploaded file's) is handed to the client as-is, uncopied.
+    """
     if not groq_client:
         log_event(logging.WARNING, "groq_unavailable")
         return ""
     
     try:
-        audio_file = io.BytesIO(audio_data)
-        audio_file.name = "audio.wav"
-        
         transcription = groq_client.audio.transcriptions.create(
-            file=audio_file,
+            file=(filename, audio_stream),
             model="whisper-large-v3",
             response_format="text"
         )
@@ -67,33 +90,14 @@ def transcribe_audio(audio_data: bytes) -> str:
 
 # --- GEMINI OPERATIONS ---
 
-def gemini_update_file(
-    current_content: str,
-    target_section: Optional[str],
-    new_transcript: str,
-    action: str,  # "update" or "create"
-    previous_context: Optional[str] = None
-) -> Tuple[str, Dict]:
-    """
-    Use Gemini to update the markdown file.
-    Returns (new_content, change_info).
-    
-    previous_context: Recent transcription for continuity understanding
-    """
-    if not gemini_model:
-        log_event(logging.WARNING, "gemini_unavailable_fallback", action=action)
-        return fallback_update(current_content, target_section, new_transcript, action)
-    
-    context_block = ""
-    if previous_context:
-        context_block = f"""
+# Prompt templates, filled with str.format_map per request
+_CONTEXT_TEMPLATE = """
 **Previous Context (for continuity):**
 "{previous_context}"
 
 """
-    
-    if action == "create":
-        prompt = f"""You are a Recursive Markdown Editor for a note-taking app.
+
+_CREATE_PROMPT = """You are a Recursive Markdown Editor for a note-taking app.
 
 **Current File State:**
 ```markdown
@@ -112,8 +116,7 @@ This is a NEW TOPIC. Create a new section (## heading) for this content.
 
 Return ONLY the markdown content, no code blocks or explanations."""
 
-    else:  # update
-        prompt = f"""You are a Recursive Markdown Editor for a note-taking app.
+_UPDATE_PROMPT = """You are a Recursive Markdown Editor for a note-taking app.
 
 **Current File State:**
 ```markdown
@@ -136,25 +139,121 @@ Rewrite the **Target Section** only to incorporate the new information:
 Return the ENTIRE updated Markdown file with only the target section modified.
 Return ONLY the markdown content, no code blocks or explanations."""
 
+# Update prompt when the target section can be located: only that section is
+# sent, and the rewrite is spliced back into the file locally
+_UPDATE_SECTION_PROMPT = """You are a Recursive Markdown Editor for a note-taking app.
+
+**Target Section:**
+```markdown
+{section_content}
+```
+{context_block}**New Input (from voice transcription):**
+"{new_transcript}"
+
+**Instruction:**
+Rewrite the **Target Section** to incorporate the new information:
+1. If the user CORRECTED themselves (e.g., "actually, use X instead of Y"), REPLACE the old information completely with the new correct information. Do NOT use strikethrough - just update to the correct value.
+2. If they ADDED detail, integrate it into existing bullet points or add new ones.
+3. If they EXPANDED on a point, refine that bullet.
+4. Keep it concise - no redundant information.
+5. Use the previous context to understand continuity if provided.
+6. NEVER use ~~strikethrough~~ formatting - always replace outdated info cleanly.
+
+Return ONLY the rewritten section, starting with its heading line unchanged.
+Return ONLY the markdown content, no code blocks or explanations."""
+
+
+def _section_span(content: str, section_id: str) -> Optional[Tuple[int, int]]:
+    """
+    Character span of the section with section_id (heading line through body).
+    Matched by id rather than heading, since headings can repeat; None if the
+    section no longer exists in content.
+    """
+    for section in parse_markdown_sections(content):
+        if section.id == section_id:
+            start = 0
+            for _ in range(section.line_start):
+                start = content.index('\n', start) + 1
+            # Section content is the stripped slice starting at its heading line
+            return start, start + len(section.content)
+    return None
+
+
+def gemini_update_file(
+    current_content: str,
+    target_section: Optional[str],
+    new_transcript: str,
+    action: str,  # "update" or "create"
+    previous_context: Optional[str] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+    target_section_id: Optional[str] = None
+) -> Tuple[str, Dict]:
+    """
+    Use Gemini to update the markdown file.
+    Returns (new_content, change_info).
+    
+    previous_context: Recent transcription for continuity understanding
+    on_delta: Called with each chunk of text as the response streams in
+    target_section_id: Id of the target section; when it is found in
+        current_content, only that section is sent and rewritten
+    """
+    if not gemini_model:
+        log_event(logging.WARNING, "gemini_unavailable_fallback", action=action)
+        return fallback_update(current_content, target_section, new_transcript, action, target_section_id)
+    
+    fields = {
+        "current_content": current_content,
+        "target_section": target_section,
+        "new_transcript": new_transcript,
+        "context_block": _CONTEXT_TEMPLATE.format_map({"previous_context": previous_context}) if previous_context else "",
+    }
+    span = _section_span(current_content, target_section_id) if action == "update" and target_section_id else None
+    if action == "create":
+        template = _CREATE_PROMPT
+    elif span:
+        template = _UPDATE_SECTION_PROMPT
+        fields["section_content"] = current_content[span[0]:span[1]]
+    else:
+        template = _UPDATE_PROMPT
+    prompt = template.format_map(fields)
+    
     try:
-        log_event(logging.INFO, "gemini_request", action=action, target_section=target_section)
-        response = gemini_model.generate_content(prompt)
-        new_content = response.text.strip()
+        log_event(logging.INFO, "gemini_request", action=action, target_section=target_section,
+                  section_only=span is not None, prompt_chars=len(prompt))
+        response = gemini_model.generate_content(prompt, stream=True)
+        
+        chunks = []
+        for chunk in response:
+            try:
+                delta = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. a bare finish reason)
+                continue
+            chunks.append(delta)
+            if on_delta:
+                on_delta(delta)
         
         # Clean up if wrapped in code blocks
-        if new_content.startswith("```markdown"):
-            new_content = new_content[11:]
-        if new_content.startswith("```"):
-            new_content = new_content[3:]
-        if new_content.endswith("```"):
-            new_content = new_content[:-3]
-        new_content = new_content.strip()
+        generated = _CODE_FENCE_RE.sub('', "".join(chunks)).strip()
+        if span:
+            if not generated:
+                raise ValueError("empty section rewrite")
+            # A renamed or dropped heading would change the section's ID (and
+            # leave the index pointing at a section that no longer exists)
+            heading_end = current_content.find('\n', span[0], span[1])
+            heading_line = current_content[span[0]:span[1] if heading_end == -1 else heading_end].rstrip()
+            if not generated.startswith(heading_line):
+                raise ValueError("section rewrite changed its heading")
+            # Splice the rewritten section in place of the original
+            new_content = current_content[:span[0]] + generated + current_content[span[1]:]
+        else:
+            new_content = generated
         
         # If create action, try to find the new heading for animation
         extracted_section = target_section
         if action == "create":
             # Find the last ## heading in the new content
-            headings = re.findall(r'^##\s+(.+)$', new_content, re.MULTILINE)
+            headings = _H2_HEADING_RE.findall(new_content)
             if headings:
                 extracted_section = headings[-1].strip()
         
@@ -166,14 +265,15 @@ Return ONLY the markdown content, no code blocks or explanations."""
         
     except Exception as e:
         log_event(logging.ERROR, "gemini_error_fallback", error=str(e), action=action)
-        return fallback_update(current_content, target_section, new_transcript, action)
+        return fallback_update(current_content, target_section, new_transcript, action, target_section_id)
 
 
 def fallback_update(
     current_content: str,
     target_section: Optional[str],
     new_transcript: str,
-    action: str
+    action: str,
+    target_section_id: Optional[str] = None
 ) -> Tuple[str, Dict]:
     """Fallback update without Gemini - simple append logic."""
     
@@ -189,34 +289,30 @@ def fallback_update(
         return new_content, {
             "action": "create",
             "target_section": heading,
-            "lines_added": [len(current_content.split('\n')) + 1]
+            "lines_added": [current_content.count('\n') + 2]
         }
     
-    # Update: append to target section
-    lines = current_content.split('\n')
-    new_lines = []
-    found_target = False
-    inserted = False
+    # Update: append a bullet to the target section, splicing by offset
+    new_content = current_content
+    span = _section_span(current_content, target_section_id) if target_section_id else None
+    target_pos = current_content.find(target_section) if target_section and not span else -1
     
-    for i, line in enumerate(lines):
-        new_lines.append(line)
-        
-        # Find target section heading
-        if not found_target and target_section and target_section in line:
-            found_target = True
-            continue
+    if span:
+        # Located by ID, so repeated headings can't send the bullet elsewhere
+        new_content = f"{current_content[:span[1]]}\n- {new_transcript}{current_content[span[1]:]}"
+    elif target_pos != -1:
+        # Insert before the next heading after the target's line, or append at end
+        line_end = current_content.find('\n', target_pos)
+        next_heading = current_content.find('\n#', line_end) if line_end != -1 else -1
         
-        # Insert before next heading if we found target
-        if found_target and not inserted and line.startswith('#'):
-            new_lines.insert(len(new_lines) - 1, f"- {new_transcript}")
-            inserted = True
-    
-    # Append at end if target found but no next heading
-    if found_target and not inserted:
-        new_lines.append(f"- {new_transcript}")
+        if next_heading != -1:
+            insert_at = next_heading + 1
+            new_content = f"{current_content[:insert_at]}- {new_transcript}\n{current_content[insert_at:]}"
+        else:
+            new_content = f"{current_content}\n- {new_transcript}"
     
     log_event(logging.INFO, "fallback_update_section", heading=target_section)
-    return '\n'.join(new_lines), {
+    return new_content, {
         "action": "update",
         "target_section": target_section,
         "lines_modified": []
@@ -228,21 +324,13 @@ def calculate_diff(old_content: str, new_content: str, target_section: Optional[
     old_lines = old_content.split('\n')
     new_lines = new_content.split('\n')
     
-    changed_lines = []
-    added_lines = []
-    
-    # Simple diff - find changed lines
-    max_len = max(len(old_lines), len(new_lines))
-    
-    for i in range(max_len):
-        old_line = old_lines[i] if i < len(old_lines) else None
-        new_line = new_lines[i] if i < len(new_lines) else None
-        
-        if old_line != new_line:
-            if old_line is None:
-                added_lines.append(i + 1)
-            else:
-                changed_lines.append(i + 1)
+    # Compare the overlapping lines in one vectorized pass; lines past the end
+    # of the old content are additions, old lines past the new end are changes
+    common = min(len(old_lines), len(new_lines))
+    mismatched = np.array(old_lines[:common], dtype=object) != np.array(new_lines[:common], dtype=object)
+    changed_lines = (np.flatnonzero(mismatched) + 1).tolist()
+    changed_lines.extend(range(common + 1, len(old_lines) + 1))
+    added_lines = list(range(common + 1, len(new_lines) + 1))
     
     return {
         "target_section": target_section,
@@ -2,16 +2,26 @@
 Markdown file operations.
 """
 
-import re
+import os
 import hashlib
 import logging
-from typing import List
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
 
 from config import (
     log_event,
     get_project_path,
 )
 from models import MarkdownSection
+from state import NOTES_GENERATION
+
+# Notes files already known to exist, so ensure_notes_file can skip the check
+_existing_notes: Dict[str, Path] = {}
+
+# Last content read per project, keyed by the file's (st_mtime_ns, st_size)
+_notes_cache: Dict[str, Tuple[Tuple[int, int], str]] = {}
 
 
 def initial_content(project_name: str) -> str:
@@ -19,28 +29,75 @@ def initial_content(project_name: str) -> str:
     return f"# {project_name}\n\n"
 
 
-def ensure_notes_file(project_name: str):
+def ensure_notes_file(project_name: str) -> Path:
     """Create project notes file if it doesn't exist and return its path."""
+    path = _existing_notes.get(project_name)
+    if path is not None:
+        return path
+    
     path = get_project_path(project_name)
     if not path.exists():
         path.write_text(initial_content(project_name))
         log_event(logging.INFO, "notes_file_created", project=project_name, path=str(path))
+    _existing_notes[project_name] = path
     return path
 
 
 def read_notes_file(project_name: str) -> str:
     """Read the current state of the project's notes."""
     path = ensure_notes_file(project_name)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        # Deleted behind our back; recreate it
+        _existing_notes.pop(project_name, None)
+        path = ensure_notes_file(project_name)
+        stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _notes_cache.get(project_name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    
     content = path.read_text(encoding='utf-8')
+    if cached is not None:
+        # Edited outside write_notes_file (which primes the cache); anything
+        # derived from the old content is stale
+        NOTES_GENERATION[project_name] += 1
+    _notes_cache[project_name] = (signature, content)
     log_event(logging.DEBUG, "notes_file_read", project=project_name, bytes=len(content))
     return content
 
 
 def write_notes_file(project_name: str, content: str) -> bool:
-    """Write content to a project's notes.md. Returns True on success."""
+    """
+    Write content to a project's notes.md. Returns True on success.
+    The file is replaced atomically; writing unchanged content is a no-op.
+    """
     try:
+        if read_notes_file(project_name) == content:
+            log_event(logging.DEBUG, "notes_file_unchanged", project=project_name)
+            return True
+        
         path = ensure_notes_file(project_name)
-        path.write_text(content, encoding='utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                os.chmod(tmp_path, path.stat().st_mode & 0o777)
+                f.write(content)
+                f.flush()
+                stat = os.fstat(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if '\r' in content:
+            # Reading back would normalize the line endings; let it re-read
+            _notes_cache.pop(project_name, None)
+        else:
+            # The rename keeps the temp file's signature, so the sync and SSE
+            # readers that follow get this content (and its memoized parse)
+            _notes_cache[project_name] = ((stat.st_mtime_ns, stat.st_size), content)
+        NOTES_GENERATION[project_name] += 1
         log_event(logging.INFO, "notes_file_written", project=project_name, bytes=len(content))
         return True
     except Exception as e:
@@ -52,29 +109,61 @@ def parse_markdown_sections(content: str) -> List[MarkdownSection]:
     """
     Parse markdown content into sections based on headings.
     Each section includes the heading and all content until the next heading.
+    Parses are memoized by content, so callers must not mutate the sections.
+    """
+    return list(_parse_sections(content))
+
+
+def parse_section_dicts(content: str) -> List[Dict]:
+    """
+    Sections of content as plain dicts, ready for JSON responses.
+    Memoized alongside the parse, so the dicts are shared and must not be mutated.
     """
-    lines = content.split('\n')
+    return list(_section_dicts(content))
+
+
+@lru_cache(maxsize=32)
+def _section_dicts(content: str) -> Tuple[Dict, ...]:
+    """Serialize the memoized parse of content (see parse_section_dicts)."""
+    return tuple(section.to_dict() for section in _parse_sections(content))
+
+
+@lru_cache(maxsize=32)
+def _parse_sections(content: str) -> Tuple[MarkdownSection, ...]:
+    """Parse content into sections (memoized; see parse_markdown_sections)."""
     sections = []
     current_section = None
+    current_offset = 0  # Character offset of the current section's heading
     
-    heading_pattern = re.compile(r'^(#{1,6})\s+(.+)$')
-    
-    for i, line in enumerate(lines):
-        match = heading_pattern.match(line)
+    # Only lines starting with '#' can be headings, so jump between them with
+    # str.find instead of splitting every line; line numbers come from counting
+    # the newlines skipped over, and bodies are sliced straight out of content
+    if content.startswith('#'):
+        offset = 0
+    else:
+        offset = content.find('\n#')
+        if offset != -1:
+            offset += 1
+    i = content.count('\n', 0, max(offset, 0))  # Line number of offset
+    while offset != -1:
+        line_end = content.find('\n', offset)
+        line = content[offset:] if line_end == -1 else content[offset:line_end]
         
-        if match:
+        # Headings are 1-6 '#' followed by whitespace and a title
+        level = 1
+        while level < 7 and level < len(line) and line[level] == '#':
+            level += 1
+        
+        if level <= 6 and len(line) > level + 1 and line[level].isspace():
             # Close previous section
             if current_section:
                 current_section.line_end = i - 1
-                current_section.content = '\n'.join(
-                    lines[current_section.line_start:i]
-                ).strip()
+                current_section.content = content[current_offset:offset].strip()
                 sections.append(current_section)
             
             # Start new section
-            level = len(match.group(1))
-            heading = match.group(2).strip()
-            section_id = hashlib.md5(f"{heading}:{i}".encode()).hexdigest()[:12]
+            heading = line[level:].strip()
+            section_id = hashlib.blake2b(f"{heading}:{i}".encode(), digest_size=6).hexdigest()
             
             current_section = MarkdownSection(
                 id=section_id,
@@ -84,14 +173,19 @@ def parse_markdown_sections(content: str) -> List[MarkdownSection]:
                 line_start=i,
                 line_end=i
             )
+            current_offset = offset
+        
+        next_candidate = content.find('\n#', offset)
+        if next_candidate == -1:
+            break
+        i += content.count('\n', offset, next_candidate + 1)
+        offset = next_candidate + 1
     
     # Close last section
     if current_section:
-        current_section.line_end = len(lines) - 1
-        current_section.content = '\n'.join(
-            lines[current_section.line_start:]
-        ).strip()
+        current_section.line_end = content.count('\n')
+        current_section.content = content[current_offset:].strip()
         sections.append(current_section)
     
     log_event(logging.DEBUG, "markdown_sections_parsed", sections=len(sections))
-    return sections
+    return tuple(sections)
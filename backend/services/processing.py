@@ -2,79 +2,142 @@
 Main transcript processing logic.
 """
 
-import uuid
 import logging
+import secrets
 from datetime import datetime
-from dataclasses import asdict
-from typing import Optional, Dict
+from typing import Callable, Optional, Dict, List
+
+import numpy as np
+import orjson
 
 from config import log_event, SIMILARITY_THRESHOLD
-from models import PendingUpdate
+from models import ClientChannel, PendingUpdate
 from state import (
     TRANSCRIPT_LOGS,
     PENDING_UPDATES,
+    PENDING_LOCK,
     CONNECTED_CLIENTS,
+    CLIENTS_LOCK,
     CONTEXT_HISTORY,
+    NOTES_LOCKS,
+    recent_entries,
 )
 from services.markdown import read_notes_file, write_notes_file
-from services.vectordb import sync_chromadb_with_file, find_relevant_section
+from services.vectordb import schedule_sync, find_relevant_section
 from services.ai import detect_ambiguous_intent, gemini_update_file
 
 
 # --- SSE BROADCASTING ---
 
+def sse_frame(data: Dict) -> bytes:
+    """Encode an event as a complete SSE `data:` frame."""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+# Heartbeats never change, so their frame is encoded once
+HEARTBEAT_FRAME: bytes = sse_frame({"type": "heartbeat"})
+
+
+def register_client(project_name: str) -> ClientChannel:
+    """Register a new SSE client for a project and return its event channel."""
+    channel = ClientChannel()
+    with CLIENTS_LOCK:
+        CONNECTED_CLIENTS[project_name].add(channel)
+    return channel
+
+
+def unregister_client(project_name: str, channel: ClientChannel):
+    """Stop delivering a project's events to a disconnected SSE client."""
+    with CLIENTS_LOCK:
+        CONNECTED_CLIENTS[project_name].discard(channel)
+
+
 def broadcast_event(project_name: str, data: Dict):
     """Broadcast an event to all connected SSE clients for a project."""
-    for client_queue in CONNECTED_CLIENTS[project_name]:
-        try:
-            client_queue.put(data)
-        except Exception as e:
-            log_event(logging.DEBUG, "sse_client_send_failed", project=project_name, error=str(e))
+    with CLIENTS_LOCK:
+        clients = tuple(CONNECTED_CLIENTS[project_name])
+    # Encode once; every client channel receives the same bytes
+    frame = sse_frame(data) if clients else b""
+    overflowed = sum(not channel.push(frame) for channel in clients)
+    if overflowed:
+        # Slow or stalled streams lose their oldest frames rather than holding up the broadcaster
+        log_event(logging.WARNING, "sse_client_overflow", project=project_name,
+                  type=data.get("type"), clients=overflowed)
     log_event(logging.DEBUG, "sse_broadcast", project=project_name, type=data.get("type"))
 
 
+def _partial_broadcaster(project_name: str, section: Optional[str]) -> Callable[[str], None]:
+    """Callback that forwards streamed Gemini text to a project's SSE clients."""
+    def on_delta(delta: str):
+        broadcast_event(project_name, {"type": "partial", "delta": delta, "section": section})
+    return on_delta
+
+
+# --- PENDING UPDATES ---
+
+def list_pending(project_name: str) -> List[PendingUpdate]:
+    """Snapshot of a project's pending updates, oldest first."""
+    with PENDING_LOCK:
+        return list(PENDING_UPDATES[project_name].values())
+
+
+def clear_pending(project_name: str):
+    """Drop all of a project's pending updates."""
+    with PENDING_LOCK:
+        PENDING_UPDATES[project_name].clear()
+
+
+def _restore_pending(project_name: str, pending: PendingUpdate):
+    """Put back a claimed pending update whose resolution didn't go through."""
+    with PENDING_LOCK:
+        PENDING_UPDATES[project_name][pending.id] = pending
+
+
 # --- MAIN PROCESSING ---
 
-def process_transcript(text: str, project_name: str, previous_context: Optional[str] = None) -> Dict:
+def process_transcript(
+    text: str,
+    project_name: str,
+    previous_context: Optional[str] = None,
+    query_embedding: Optional[np.ndarray] = None
+) -> Dict:
     """
     Main logic: Process new transcript and update notes.md.
     Uses vector similarity (threshold: 0.55) to match to existing sections.
     Only creates pending updates for ambiguous intent (e.g., "wait, no...").
     
     previous_context: Recent transcription context for continuity
+    query_embedding: Precomputed embedding of text, if already available
     """
-    pending_list = PENDING_UPDATES[project_name]
     transcript_log = TRANSCRIPT_LOGS[project_name]
     context_history = CONTEXT_HISTORY[project_name]
+    # One timestamp for the transcript and any pending update it creates
+    timestamp = datetime.now().isoformat()
     
     # Build combined context from history
     if previous_context:
         combined_context = previous_context
     elif context_history:
-        combined_context = " ".join(context_history[-3:])  # Last 3 chunks
+        combined_context = " ".join(recent_entries(context_history, 3))  # Last 3 chunks
     else:
         combined_context = None
     
-    # Add current text to context history (keep last 5)
+    # Add current text to context history (deque keeps the last 5)
     context_history.append(text)
-    if len(context_history) > 5:
-        context_history.pop(0)
     
     log_event(logging.INFO, "context_update", project=project_name, history_len=len(context_history), has_prev=bool(combined_context))
     
     # Add to transcript log
     transcript_log.append({
         "text": text,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": timestamp
     })
-    if len(transcript_log) > 20:
-        transcript_log.pop(0)
     
     # Step 1: Check for ambiguous intent (e.g., "wait, no...", "scratch that")
     is_ambiguous, ambiguity_reason = detect_ambiguous_intent(text)
     
     # Step 2: Find relevant section via vector similarity
-    section_id, heading, similarity = find_relevant_section(text, project_name)
+    section_id, heading, similarity = find_relevant_section(text, project_name, query_embedding)
     has_match = similarity >= SIMILARITY_THRESHOLD
     
     # Step 3: Handle ambiguous intent - ask user to confirm
@@ -89,21 +152,23 @@ def process_transcript(text: str, project_name: str, previous_context: Optional[
     
     if is_ambiguous:
         pending = PendingUpdate(
-            id=str(uuid.uuid4())[:8],
+            id=secrets.token_hex(4),
             transcript=text,
             matched_section=heading if has_match else None,
             similarity=similarity,
             suggested_action="update" if has_match else "create",
             reason=ambiguity_reason,
-            timestamp=datetime.now().isoformat()
+            timestamp=timestamp,
+            matched_section_id=section_id if has_match else None
         )
-        pending_list.append(pending)
+        with PENDING_LOCK:
+            PENDING_UPDATES[project_name][pending.id] = pending
         log_event(logging.INFO, "pending_update_created", project=project_name, pending_id=pending.id, reason=pending.reason)
         
         # Broadcast pending update
         broadcast_event(project_name, {
             "type": "pending_update",
-            "pending": asdict(pending)
+            "pending": pending.to_dict()
         })
         
         return {
@@ -114,22 +179,35 @@ def process_transcript(text: str, project_name: str, previous_context: Optional[
             "matched_section": heading
         }
     
-    # Step 4: Execute the update
-    current_content = read_notes_file(project_name)
+    # Step 4: Execute the update (the lock spans read to write, or a concurrent
+    # update of the same notes would be lost)
     action = "update" if has_match else "create"
+    with NOTES_LOCKS[project_name]:
+        current_content = read_notes_file(project_name)
+        
+        new_content, change_info = gemini_update_file(
+            current_content,
+            heading,
+            text,
+            action,
+            previous_context=combined_context,
+            on_delta=_partial_broadcaster(project_name, heading if action == "update" else None),
+            target_section_id=section_id if action == "update" else None
+        )
+        
+        # Step 5: Write to file
+        written = write_notes_file(project_name, new_content)
+        if written:
+            # Broadcast update (under the lock, so clients get writes in order)
+            broadcast_event(project_name, {
+                "type": "file_updated",
+                "content": new_content,
+                "change_info": change_info,
+                "action": action,
+                "section": heading if action == "update" else None
+            })
     
-    new_content, change_info = gemini_update_file(
-        current_content,
-        heading,
-        text,
-        action,
-        previous_context=combined_context
-    )
-    
-    # Step 5: Write to file
-    if write_notes_file(project_name, new_content):
-        # Sync ChromaDB
-        sync_chromadb_with_file(project_name)
+    if written:
         log_event(
             logging.INFO,
             "transcript_applied",
@@ -138,15 +216,8 @@ def process_transcript(text: str, project_name: str, previous_context: Optional[
             section=heading if action == "update" else change_info.get("target_section"),
             similarity=round(similarity, 3)
         )
-        
-        # Broadcast update
-        broadcast_event(project_name, {
-            "type": "file_updated",
-            "content": new_content,
-            "change_info": change_info,
-            "action": action,
-            "section": heading if action == "update" else None
-        })
+        # Re-index in the background; the next query waits for it if needed
+        schedule_sync(project_name)
         
         return {
             "status": "success",
@@ -157,6 +228,8 @@ def process_transcript(text: str, project_name: str, previous_context: Optional[
         }
     
     log_event(logging.ERROR, "transcript_apply_failed", project=project_name)
+    # Clients drop the draft they streamed for this update
+    broadcast_event(project_name, {"type": "update_failed"})
     return {"status": "error", "message": "Failed to write file"}
 
 
@@ -165,47 +238,51 @@ def resolve_pending_update(pending_id: str, action: str, project_name: str) -> D
     Resolve a pending update with user confirmation.
     action: "approve", "reject", "create_new", "update_section"
     """
-    pending_list = PENDING_UPDATES[project_name]
-    pending = next((p for p in pending_list if p.id == pending_id), None)
+    # Claim the update so concurrent resolutions can't apply it twice
+    with PENDING_LOCK:
+        pending = PENDING_UPDATES[project_name].pop(pending_id, None)
     if not pending:
         log_event(logging.WARNING, "pending_update_not_found", pending_id=pending_id)
         return {"status": "error", "message": "Pending update not found"}
     
     if action == "reject":
-        PENDING_UPDATES[project_name] = [p for p in pending_list if p.id != pending_id]
         broadcast_event(project_name, {"type": "pending_resolved", "pending_id": pending_id, "action": "rejected"})
         log_event(logging.INFO, "pending_update_rejected", pending_id=pending_id)
         return {"status": "rejected"}
     
-    # Execute the action
-    current_content = read_notes_file(project_name)
-    
     if action == "create_new":
-        new_content, change_info = gemini_update_file(
-            current_content, None, pending.transcript, "create", previous_context=None
-        )
+        target, target_id, update_action = None, None, "create"
     elif action in ["approve", "update_section"]:
-        target = pending.matched_section
-        new_content, change_info = gemini_update_file(
-            current_content, target, pending.transcript, "update" if target else "create", previous_context=None
-        )
+        target, target_id = pending.matched_section, pending.matched_section_id
+        update_action = "update" if target else "create"
     else:
+        _restore_pending(project_name, pending)
         log_event(logging.WARNING, "pending_update_unknown_action", action=action)
         return {"status": "error", "message": f"Unknown action: {action}"}
     
-    if write_notes_file(project_name, new_content):
-        PENDING_UPDATES[project_name] = [p for p in pending_list if p.id != pending_id]
-        sync_chromadb_with_file(project_name)
+    # Execute the action (read to write under the project's notes lock)
+    with NOTES_LOCKS[project_name]:
+        current_content = read_notes_file(project_name)
+        new_content, change_info = gemini_update_file(
+            current_content, target, pending.transcript, update_action, previous_context=None,
+            on_delta=_partial_broadcaster(project_name, target), target_section_id=target_id
+        )
+        written = write_notes_file(project_name, new_content)
+        if written:
+            broadcast_event(project_name, {
+                "type": "file_updated",
+                "content": new_content,
+                "change_info": change_info,
+                "pending_resolved": pending_id
+            })
+    
+    if written:
         log_event(logging.INFO, "pending_update_applied", pending_id=pending_id, action=action)
-        
-        broadcast_event(project_name, {
-            "type": "file_updated",
-            "content": new_content,
-            "change_info": change_info,
-            "pending_resolved": pending_id
-        })
+        schedule_sync(project_name)
         
         return {"status": "success", "change_info": change_info}
     
+    _restore_pending(project_name, pending)
     log_event(logging.ERROR, "pending_update_apply_failed", pending_id=pending_id)
+    broadcast_event(project_name, {"type": "update_failed", "pending_id": pending_id})
     return {"status": "error", "message": "Failed to write file"}
@@ -1,32 +1,68 @@
 """
 Queue processor for FIFO transcript processing.
-Ensures transcripts are processed in the order they were received.
+Ensures each project's transcripts are processed in the order they were
+received, while independent projects are processed concurrently.
 """
 
 import logging
+import secrets
 import threading
-import uuid
-from typing import Dict, Optional
+import time
+from queue import Empty
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 
+import numpy as np
+
 from config import log_event
-from state import PROCESSING_QUEUE, PROCESSING_LOCK, PROCESSING_RESULTS
+from state import (
+    PROCESSING_QUEUE,
+    PROCESSING_SHARDS,
+    PROCESSING_RESULTS_SHARDS,
+    PROCESSING_LOCKS,
+    processing_shard,
+)
 
 
-@dataclass
+@dataclass(slots=True)
 class QueueItem:
     """Item in the processing queue."""
     request_id: str
     text: str
     project: str
-    timestamp: datetime
+    queued_at_ns: int
     chunk_num: Optional[int] = None
 
 
-# Background worker thread
+# Maximum number of queued items drained per worker iteration
+BATCH_MAX: int = 16
+
+# Keep roughly the last 100 finished results, split evenly across shards
+# (queued and processing entries are never evicted)
+MAX_RESULTS: int = 100
+RESULTS_PER_SHARD: int = -(-MAX_RESULTS // PROCESSING_SHARDS)
+
+# Finished request IDs per shard, oldest first (guarded by the shard's lock)
+_finished: List[Deque[str]] = [deque() for _ in range(PROCESSING_SHARDS)]
+
+# Number of single-threaded processing lanes; a project always maps to the
+# same lane, so its transcripts stay in order while other projects overlap
+QUEUE_WORKER_LANES: int = 4
+
+# Background worker (dispatcher) thread and processing lanes
 _worker_thread: Optional[threading.Thread] = None
-_worker_running = False
+_worker_running: bool = False
+_lanes: List[ThreadPoolExecutor] = []
+
+# Raw nanosecond timestamps stored per result, and the ISO fields they're served as
+_TIMESTAMP_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("queued_at_ns", "queued_at"),
+    ("started_at_ns", "started_at"),
+    ("completed_at_ns", "completed_at"),
+)
 
 
 def enqueue_transcript(text: str, project: str, chunk_num: Optional[int] = None) -> str:
@@ -34,24 +70,28 @@ def enqueue_transcript(text: str, project: str, chunk_num: Optional[int] = None)
     Add a transcript to the processing queue.
     Returns a request_id that can be used to check the result.
     """
-    request_id = str(uuid.uuid4())[:8]
+    # Random, not sequential: the ID alone grants access to the result
+    request_id = secrets.token_hex(4)
     
     item = QueueItem(
         request_id=request_id,
         text=text,
         project=project,
-        timestamp=datetime.now(),
+        queued_at_ns=time.time_ns(),
         chunk_num=chunk_num
     )
     
-    # Initialize result slot
-    with PROCESSING_LOCK:
-        PROCESSING_RESULTS[request_id] = {
+    # Initialize result slot (only this request's shard is locked)
+    shard = processing_shard(request_id)
+    results = PROCESSING_RESULTS_SHARDS[shard]
+    with PROCESSING_LOCKS[shard]:
+        results[request_id] = {
             "status": "queued",
-            "queued_at": item.timestamp.isoformat(),
+            "queued_at_ns": item.queued_at_ns,
             "project": project,
             "chunk_num": chunk_num
         }
+        results.move_to_end(request_id)
     
     PROCESSING_QUEUE.put(item)
     queue_size = PROCESSING_QUEUE.qsize()
@@ -66,111 +106,159 @@ def enqueue_transcript(text: str, project: str, chunk_num: Optional[int] = None)
     return request_id
 
 
-def get_result(request_id: str) -> Optional[Dict]:
-    """Get the result for a request ID."""
-    with PROCESSING_LOCK:
-        return PROCESSING_RESULTS.get(request_id)
+def get_result(request_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the result for a request ID (timestamps formatted as ISO strings).
+    Lock-free: dict.get and the dict() copy are each atomic under the GIL, and
+    the worker publishes status last, so readers get a consistent snapshot.
+    """
+    stored = PROCESSING_RESULTS_SHARDS[processing_shard(request_id)].get(request_id)
+    if stored is None:
+        return None
+    result = dict(stored)
+    
+    for ns_field, iso_field in _TIMESTAMP_FIELDS:
+        if ns_field in result:
+            result[iso_field] = datetime.fromtimestamp(result.pop(ns_field) / 1e9).isoformat()
+    return result
+
+
+def _mark_started(request_id: str) -> None:
+    """Mark a request as processing once its lane actually picks it up."""
+    started_at_ns = time.time_ns()
+    shard = processing_shard(request_id)
+    with PROCESSING_LOCKS[shard]:
+        slot = PROCESSING_RESULTS_SHARDS[shard].get(request_id)
+        if slot is not None:
+            slot["started_at_ns"] = started_at_ns
+            slot["status"] = "processing"
+
+
+def _store_outcome(request_id: str, status: str, field: str, value: Any) -> None:
+    """Record a finished item's outcome and drop the shard's oldest finished results."""
+    completed_at_ns = time.time_ns()
+    shard = processing_shard(request_id)
+    results = PROCESSING_RESULTS_SHARDS[shard]
+    with PROCESSING_LOCKS[shard]:
+        slot = results.get(request_id)
+        if slot is not None:
+            # Publish status last so lock-free readers never see it without its payload
+            slot[field] = value
+            slot["completed_at_ns"] = completed_at_ns
+            slot["status"] = status
+            finished = _finished[shard]
+            finished.append(request_id)
+            while len(finished) > RESULTS_PER_SHARD:
+                del results[finished.popleft()]
+
 
+def _lane_for(project: str) -> ThreadPoolExecutor:
+    """Processing lane that owns a project."""
+    return _lanes[hash(project) % len(_lanes)]
 
-def _process_queue():
-    """Background worker that processes queue items in FIFO order."""
+
+def _process_item(item: QueueItem, embedding: Optional[np.ndarray]) -> None:
+    """Process a single queue item on its project's lane and store the result."""
+    # Import here to avoid circular imports
+    from services.processing import process_transcript
+    
+    try:
+        # Items wait in their lane behind earlier ones; until now they're still queued
+        _mark_started(item.request_id)
+        log_event(logging.INFO, "queue_process_start",
+                  request_id=item.request_id,
+                  project=item.project,
+                  chunk_num=item.chunk_num,
+                  queue_remaining=PROCESSING_QUEUE.qsize())
+        
+        # Actually process the transcript
+        result = process_transcript(item.text, item.project, query_embedding=embedding)
+        result["transcription"] = item.text
+        result["project"] = item.project
+        result["chunk_num"] = item.chunk_num
+        
+        # Store result and clean up old ones (oldest first by insertion)
+        _store_outcome(item.request_id, "completed", "result", result)
+        
+        log_event(logging.INFO, "queue_process_complete",
+                  request_id=item.request_id,
+                  project=item.project,
+                  chunk_num=item.chunk_num,
+                  action=result.get("action"))
+        
+    except Exception as e:
+        log_event(logging.ERROR, "queue_process_error",
+                  request_id=item.request_id,
+                  error=str(e))
+        
+        _store_outcome(item.request_id, "error", "error", str(e))
+
+
+def _process_queue() -> None:
+    """Background worker that dispatches queue items to lanes in FIFO order."""
     global _worker_running
     
     # Import here to avoid circular imports
-    from services.processing import process_transcript
+    from services.vectordb import get_embeddings
     
     log_event(logging.INFO, "queue_worker_started")
     
     while _worker_running:
         try:
             # Block for up to 1 second waiting for items
-            item = PROCESSING_QUEUE.get(timeout=1.0)
-        except:
+            batch = [PROCESSING_QUEUE.get(timeout=1.0)]
+        except Empty:
             # Timeout, check if we should keep running
             continue
         
+        # Drain whatever else is already waiting (up to BATCH_MAX)
+        while len(batch) < BATCH_MAX:
+            try:
+                batch.append(PROCESSING_QUEUE.get_nowait())
+            except Empty:
+                break
+        
+        # Embed every transcript in the batch with one model invocation
+        embeddings: Sequence[Optional[np.ndarray]]
         try:
-            log_event(logging.INFO, "queue_process_start",
-                      request_id=item.request_id,
-                      project=item.project,
-                      chunk_num=item.chunk_num,
-                      queue_remaining=PROCESSING_QUEUE.qsize())
-            
-            # Update status to processing
-            with PROCESSING_LOCK:
-                if item.request_id in PROCESSING_RESULTS:
-                    PROCESSING_RESULTS[item.request_id]["status"] = "processing"
-                    PROCESSING_RESULTS[item.request_id]["started_at"] = datetime.now().isoformat()
-            
-            # Actually process the transcript
-            result = process_transcript(item.text, item.project)
-            result["transcription"] = item.text
-            result["project"] = item.project
-            result["chunk_num"] = item.chunk_num
-            
-            # Store result
-            with PROCESSING_LOCK:
-                if item.request_id in PROCESSING_RESULTS:
-                    PROCESSING_RESULTS[item.request_id].update({
-                        "status": "completed",
-                        "completed_at": datetime.now().isoformat(),
-                        "result": result
-                    })
-            
-            log_event(logging.INFO, "queue_process_complete",
-                      request_id=item.request_id,
-                      project=item.project,
-                      chunk_num=item.chunk_num,
-                      action=result.get("action"))
-            
+            embeddings = get_embeddings([item.text for item in batch])
         except Exception as e:
-            log_event(logging.ERROR, "queue_process_error",
-                      request_id=item.request_id,
-                      error=str(e))
-            
-            with PROCESSING_LOCK:
-                if item.request_id in PROCESSING_RESULTS:
-                    PROCESSING_RESULTS[item.request_id].update({
-                        "status": "error",
-                        "error": str(e),
-                        "completed_at": datetime.now().isoformat()
-                    })
+            log_event(logging.WARNING, "queue_batch_embed_failed", batch_size=len(batch), error=str(e))
+            embeddings = [None] * len(batch)
+        
+        # Hand items to their project's lane (submission order keeps per-project FIFO)
+        for item, embedding in zip(batch, embeddings):
+            _lane_for(item.project).submit(_process_item, item, embedding)
         
-        finally:
-            PROCESSING_QUEUE.task_done()
-            
-            # Clean up old results (keep last 100)
-            with PROCESSING_LOCK:
-                if len(PROCESSING_RESULTS) > 100:
-                    # Remove oldest entries
-                    sorted_keys = sorted(
-                        PROCESSING_RESULTS.keys(),
-                        key=lambda k: PROCESSING_RESULTS[k].get("queued_at", "")
-                    )
-                    for key in sorted_keys[:-100]:
-                        del PROCESSING_RESULTS[key]
+        log_event(logging.DEBUG, "queue_batch_dispatched", batch_size=len(batch))
     
     log_event(logging.INFO, "queue_worker_stopped")
 
 
-def start_queue_worker():
+def start_queue_worker() -> None:
     """Start the background queue processing worker."""
-    global _worker_thread, _worker_running
+    global _worker_thread, _worker_running, _lanes
     
     if _worker_thread is not None and _worker_thread.is_alive():
         log_event(logging.WARNING, "queue_worker_already_running")
         return
     
+    _lanes = [
+        ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"queue-lane-{i}")
+        for i in range(QUEUE_WORKER_LANES)
+    ]
     _worker_running = True
     _worker_thread = threading.Thread(target=_process_queue, daemon=True)
     _worker_thread.start()
     log_event(logging.INFO, "queue_worker_thread_started")
 
 
-def stop_queue_worker():
+def stop_queue_worker() -> None:
     """Stop the background queue processing worker."""
     global _worker_running
     _worker_running = False
     if _worker_thread is not None:
         _worker_thread.join(timeout=5.0)
+    for lane in _lanes:
+        lane.shutdown(wait=False)
     log_event(logging.INFO, "queue_worker_thread_stopped")
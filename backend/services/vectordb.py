@@ -1,132 +1,470 @@
 """
-Vector database operations using ChromaDB.
+Section embeddings and each project's section index (kept in memory and
+persisted next to the notes).
 """
 
+import os
+import hashlib
 import logging
-from typing import Optional, Tuple
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from queue import Empty, SimpleQueue
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
 
 from config import (
     log_event,
     slugify_project,
-    chroma_client,
     embed_model,
+    INDEX_DIR,
+    EMBED_MODEL,
 )
-from state import CHROMA_COLLECTIONS
+from models import SectionIndex
+from state import SECTION_INDEXES, NOTES_GENERATION
 from services.markdown import read_notes_file, parse_markdown_sections
 
+# Memoized section lookups keyed by (project, indexed notes generation, text)
+SECTION_CACHE_SIZE = 512
+_section_cache: "OrderedDict[Tuple[str, int, str], Tuple[Optional[str], Optional[str], float]]" = OrderedDict()
+_section_cache_lock = Lock()
 
-def get_embedding(text: str) -> list:
-    """Get embedding vector for text using FastEmbed."""
-    embeddings = list(embed_model.embed([text]))
-    return embeddings[0].tolist()
+# Embeddings keyed by a content hash, so unchanged text skips the model.
+# Vectors are kept as float16 arrays and only widened to float32 for search.
+EMBEDDING_CACHE_SIZE = 4096
+EMBEDDING_DTYPE = np.float16
+_embedding_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+_embedding_cache_lock = Lock()
 
+# Post-write syncs run in the background; a per-project lock keeps two syncs of
+# the same project from interleaving their index writes
+SYNC_WORKERS = 2
+_sync_executor = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="index-sync")
+_sync_locks: Dict[str, Lock] = defaultdict(Lock)
+_pending_syncs: Dict[str, Future] = {}
 
-def get_collection(project_name: str):
-    """Get or create a Chroma collection for a project."""
-    slug = slugify_project(project_name)
-    coll_name = f"latent_loop_sections_{slug}"
-    if coll_name in CHROMA_COLLECTIONS:
-        return CHROMA_COLLECTIONS[coll_name]
-    collection = chroma_client.get_or_create_collection(
-        name=coll_name,
-        metadata={"hnsw:space": "cosine", "project": project_name}
-    )
-    CHROMA_COLLECTIONS[coll_name] = collection
-    return collection
+# Syncs requested within this window of each other coalesce into one
+SYNC_DEBOUNCE_SECONDS = 0.5
+# Syncs still waiting out the window: (token, timer, future) per project
+_debounced_syncs: Dict[str, Tuple[object, threading.Timer, Future]] = {}
+_debounce_lock = Lock()
 
 
-def sync_chromadb_with_file(project_name: str):
-    """Sync ChromaDB with the current state of a project's notes."""
-    slug = slugify_project(project_name)
-    coll_name = f"latent_loop_sections_{slug}"
-    log_event(logging.INFO, "chroma_sync_start", project=project_name)
+class EmbeddingBatcher:
+    """
+    Funnels embedding requests through one long-lived worker thread.
+    Requests that queue up while the model is busy are embedded together in a
+    single FastEmbed call (up to max_texts texts), so concurrent callers share
+    one model invocation instead of contending for the ONNX session.
+    """
     
-    # Clear cache
-    if coll_name in CHROMA_COLLECTIONS:
-        del CHROMA_COLLECTIONS[coll_name]
+    def __init__(self, model, max_texts: int = 32):
+        self._model = model
+        self._max_texts = max_texts
+        self._requests: "SimpleQueue[Tuple[List[str], Future]]" = SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = Lock()
     
-    # Get or create collection, then clear all existing data
-    collection = chroma_client.get_or_create_collection(
-        name=coll_name,
-        metadata={"hnsw:space": "cosine", "project": project_name}
-    )
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts, blocking until the worker has processed them."""
+        if self._thread is None:
+            self._start()
+        future: Future = Future()
+        self._requests.put((texts, future))
+        return future.result()
+    
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            count = len(batch[0][0])
+            
+            # Take whatever else is already waiting (up to max_texts texts)
+            while count < self._max_texts:
+                try:
+                    request = self._requests.get_nowait()
+                except Empty:
+                    break
+                batch.append(request)
+                count += len(request[0])
+            
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                embeddings = list(self._model.embed(texts))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            start = 0
+            for request_texts, future in batch:
+                future.set_result(embeddings[start:start + len(request_texts)])
+                start += len(request_texts)
+            if len(batch) > 1:
+                log_event(logging.DEBUG, "embedding_batch_coalesced", requests=len(batch), texts=len(texts))
+
+
+_batcher = EmbeddingBatcher(embed_model)
+
+
+def _embedding_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def get_embedding(text: str) -> np.ndarray:
+    """Get embedding vector for text using FastEmbed (cached by content hash)."""
+    return get_embeddings([text])[0]
+
+
+def get_embeddings(texts: List[str]) -> List[np.ndarray]:
+    """
+    Get embedding vectors for several texts.
+    Cached texts are served from memory; the rest go through the shared batcher
+    as a single FastEmbed call (possibly together with other callers' texts).
+    """
+    keys = [_embedding_key(text) for text in texts]
+    found: Dict[int, np.ndarray] = {}
+    missing = []
+    with _embedding_cache_lock:
+        for i, key in enumerate(keys):
+            cached = _embedding_cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                _embedding_cache.move_to_end(key)
+                found[i] = cached
     
-    # Clear existing documents in the collection
+    if missing:
+        computed = [e.astype(EMBEDDING_DTYPE) for e in _batcher.embed([texts[i] for i in missing])]
+        with _embedding_cache_lock:
+            for i, embedding in zip(missing, computed):
+                found[i] = embedding
+                _embedding_cache[keys[i]] = embedding
+                _embedding_cache.move_to_end(keys[i])
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+    
+    return [found[i] for i in range(len(texts))]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize vectors along the last axis (zero vectors are left as-is)."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _stack_embeddings(embeddings: List[np.ndarray]) -> np.ndarray:
+    """Stack embeddings into one contiguous float32 matrix (one row per vector)."""
+    if not embeddings:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(embeddings).astype(np.float32)
+
+
+def _quantize(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: (int8 rows, float32 scale per row)."""
+    scales = np.abs(matrix).max(axis=1, initial=0.0).astype(np.float32) / 127
+    safe = np.where(scales == 0, 1.0, scales)[:, None]
+    return np.round(matrix / safe).astype(np.int8), scales
+
+
+def _document_hash(document: str) -> str:
+    """Fingerprint of a section's embedded text (equal text, equal vector)."""
+    return hashlib.blake2b(document.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _replace_file(path: Path, data: bytes):
+    """Atomically replace path's contents."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
     try:
-        existing = collection.get()
-        if existing and existing['ids']:
-            collection.delete(ids=existing['ids'])
-            log_event(logging.DEBUG, "chroma_cleared_existing", project=project_name, count=len(existing['ids']))
+        with open(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _load_index(project_name: str) -> Optional[SectionIndex]:
+    """
+    A project's section index as saved by an earlier run, memory-mapped.
+    Returns None if there is none (or it was built with another model).
+    """
+    meta_path = INDEX_DIR / f"{slugify_project(project_name)}.json"
+    try:
+        meta = orjson.loads(meta_path.read_bytes())
+        if meta["model"] != EMBED_MODEL:
+            return None
+        sections = meta["sections"]
+        rows, dim = len(sections), meta["dim"]
+        if rows:
+            # Vector file layout: float32 scale per row, then the int8 rows
+            path = INDEX_DIR / meta["vectors"]
+            size = path.stat().st_size
+            if size != rows * (4 + dim):
+                raise ValueError(f"{path.name} is {size} bytes, expected {rows} rows of {dim}")
+            scales = np.memmap(path, dtype=np.float32, mode="r", shape=(rows,))
+            vectors = np.memmap(path, dtype=np.int8, mode="r", offset=4 * rows, shape=(rows, dim))
+        else:
+            vectors, scales = np.empty((0, 0), dtype=np.int8), np.empty(0, dtype=np.float32)
+    except FileNotFoundError:
+        return None
     except Exception as e:
-        log_event(logging.DEBUG, "chroma_clear_skip", project=project_name, error=str(e))
+        log_event(logging.WARNING, "section_index_load_failed", project=project_name, error=str(e))
+        return None
+    
+    return SectionIndex(
+        generation=-1,
+        ids=[section["id"] for section in sections],
+        headings=[section["heading"] for section in sections],
+        hashes=[section["hash"] for section in sections],
+        vectors=vectors,
+        scales=scales,
+    )
+
+
+def _save_index(project_name: str, index: SectionIndex):
+    """Persist a project's section index (quantized vectors plus a JSON sidecar)."""
+    slug = slugify_project(project_name)
+    # The vectors follow from the model and the hashes, so name the file after
+    # them: an unchanged set of sections reuses it, and the sidecar (written
+    # last) only ever points at a complete file
+    dim = int(index.vectors.shape[1])
+    identity = "\n".join([EMBED_MODEL, str(dim), *index.hashes])
+    key = hashlib.blake2b(identity.encode("utf-8"), digest_size=8).hexdigest()
+    vectors_path = INDEX_DIR / f"{slug}.{key}.q8"
+    if not vectors_path.exists():
+        data = index.scales.astype(np.float32).tobytes() + np.ascontiguousarray(index.vectors).tobytes()
+        _replace_file(vectors_path, data)
     
-    CHROMA_COLLECTIONS[coll_name] = collection
+    meta = {
+        "model": EMBED_MODEL,
+        "dim": dim,
+        "vectors": vectors_path.name,
+        "sections": [
+            {"id": section_id, "heading": heading, "hash": digest}
+            for section_id, heading, digest in zip(index.ids, index.headings, index.hashes)
+        ],
+    }
+    _replace_file(INDEX_DIR / f"{slug}.json", orjson.dumps(meta))
     
+    # (.f32 files are float32 matrices from before the vectors were quantized)
+    for stale in [*INDEX_DIR.glob(f"{slug}.*.q8"), *INDEX_DIR.glob(f"{slug}.*.f32")]:
+        if stale != vectors_path:
+            stale.unlink(missing_ok=True)
+
+
+def sync_section_index(project_name: str):
+    """
+    Sync a project's section index with the current state of its notes.
+    Only sections whose text changed since the last sync are embedded; the
+    rest reuse their stored vectors.
+    """
+    with _sync_locks[project_name]:
+        _sync_project(project_name)
+
+
+def _sync_project(project_name: str):
+    """Body of sync_section_index; the caller holds the project's sync lock."""
+    log_event(logging.INFO, "index_sync_start", project=project_name)
+    
+    generation = NOTES_GENERATION[project_name]
     content = read_notes_file(project_name)
     sections = parse_markdown_sections(content)
     
-    if not sections:
-        log_event(logging.INFO, "chroma_sync_no_sections", project=project_name)
-        return
-    
     # Index each section
     ids = []
+    headings = []
     documents = []
-    embeddings = []
-    metadatas = []
     
     for section in sections:
         # Skip the main title
         if section.level == 1 and section.heading == project_name:
             continue
-            
+        
         ids.append(section.id)
+        headings.append(section.heading)
         documents.append(f"{section.heading}: {section.content}")
-        embeddings.append(get_embedding(f"{section.heading}: {section.content}"))
-        metadatas.append({
-            "heading": section.heading,
-            "level": section.level,
-            "line_start": section.line_start,
-            "line_end": section.line_end
-        })
-    
-    if ids:
-        collection.add(
-            ids=ids,
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas
-        )
-        log_event(logging.INFO, "chroma_sync_complete", project=project_name, sections=len(ids))
+    hashes = [_document_hash(document) for document in documents]
+    
+    # Previous index: this process's last sync, else whatever is on disk
+    previous = SECTION_INDEXES.get(project_name) or _load_index(project_name)
+    
+    if previous is not None and ids == previous.ids and hashes == previous.hashes:
+        # Nothing to embed or save (on startup this keeps the memory-mapped vectors)
+        vectors, scales, missing, saved = previous.vectors, previous.scales, [], False
     else:
-        log_event(logging.INFO, "chroma_sync_empty_after_filter", project=project_name)
+        # One batched model call for the sections whose text isn't indexed yet
+        previous_rows = {digest: row for row, digest in enumerate(previous.hashes)} if previous else {}
+        missing = [i for i, digest in enumerate(hashes) if digest not in previous_rows]
+        reused = [i for i, digest in enumerate(hashes) if digest in previous_rows]
+        
+        dim = previous.vectors.shape[1] if reused else 0
+        if missing:
+            fresh, fresh_scales = _quantize(_normalize(_stack_embeddings(get_embeddings([documents[i] for i in missing]))))
+            dim = fresh.shape[1]
+        vectors = np.empty((len(ids), dim), dtype=np.int8)
+        scales = np.empty(len(ids), dtype=np.float32)
+        if reused:
+            rows = [previous_rows[hashes[i]] for i in reused]
+            vectors[reused] = previous.vectors[rows]
+            scales[reused] = previous.scales[rows]
+        if missing:
+            vectors[missing] = fresh
+            scales[missing] = fresh_scales
+        saved = True
+    
+    index = SectionIndex(
+        generation=generation,
+        ids=ids,
+        headings=headings,
+        hashes=hashes,
+        vectors=vectors,
+        scales=scales,
+    )
+    if saved:
+        _save_index(project_name, index)
+    SECTION_INDEXES[project_name] = index
+    log_event(logging.INFO, "index_sync_complete", project=project_name, sections=len(ids),
+              embedded=len(missing), saved=saved)
 
 
-def find_relevant_section(text: str, project_name: str) -> Tuple[Optional[str], Optional[str], float]:
+def schedule_sync(project_name: str) -> Future:
+    """
+    Queue a background sync of a project's index (e.g. after a write).
+    The sync starts once SYNC_DEBOUNCE_SECONDS pass without another request
+    for the project, so a burst of writes is indexed once.
+    """
+    with _debounce_lock:
+        queued = _debounced_syncs.pop(project_name, None)
+        if queued is not None:
+            # Still waiting: restart the window and share the queued sync
+            queued[1].cancel()
+            future = queued[2]
+        else:
+            future = Future()
+            future.add_done_callback(lambda done: _sync_finished(project_name, done))
+            _pending_syncs[project_name] = future
+        token = object()
+        timer = threading.Timer(SYNC_DEBOUNCE_SECONDS, _debounce_expired, (project_name, token))
+        timer.daemon = True
+        _debounced_syncs[project_name] = (token, timer, future)
+        timer.start()
+    return future
+
+
+def _claim_debounced(project_name: str, token: Optional[object] = None) -> Optional[Future]:
+    """Take a project's debounced sync (only if it still has token, when given)."""
+    with _debounce_lock:
+        queued = _debounced_syncs.get(project_name)
+        if queued is None or (token is not None and queued[0] is not token):
+            return None
+        del _debounced_syncs[project_name]
+    queued[1].cancel()
+    return queued[2]
+
+
+def _debounce_expired(project_name: str, token: object):
+    """Timer callback: start a debounced sync that nothing else has claimed."""
+    future = _claim_debounced(project_name, token)
+    if future is not None:
+        _sync_executor.submit(_run_sync, project_name, future)
+
+
+def _run_sync(project_name: str, future: Future):
+    """Run a claimed sync and resolve its future."""
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        sync_section_index(project_name)
+    except Exception as e:
+        future.set_exception(e)
+    else:
+        future.set_result(None)
+
+
+def _sync_finished(project_name: str, future: Future):
+    """Log a failed background sync and forget the project's finished future."""
+    error = future.exception()
+    if error is not None:
+        log_event(logging.ERROR, "index_sync_failed", project=project_name, error=str(error))
+    if _pending_syncs.get(project_name) is future:
+        _pending_syncs.pop(project_name, None)
+
+
+def _wait_for_sync(project_name: str):
+    """Block until the project's most recently scheduled sync (if any) is done."""
+    # A query shouldn't sit out the debounce window; run a waiting sync now
+    future = _claim_debounced(project_name)
+    if future is not None:
+        _run_sync(project_name, future)
+        return
+    future = _pending_syncs.get(project_name)
+    if future is not None:
+        wait([future])
+
+
+def _best_section(index: SectionIndex, query_embedding: np.ndarray) -> Optional[Tuple[str, str, float]]:
+    """Cosine search over a project's quantized section vectors."""
+    if not index.ids:
+        return None
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    similarities = (index.vectors @ query) * index.scales
+    best = int(similarities.argmax())
+    return index.ids[best], index.headings[best], float(similarities[best])
+
+
+def find_relevant_section(
+    text: str,
+    project_name: str,
+    query_embedding: Optional[np.ndarray] = None
+) -> Tuple[Optional[str], Optional[str], float]:
     """
     Find the most relevant existing section for the given text within a project.
     Returns (section_id, heading, similarity_score) or (None, None, 0).
+    
+    query_embedding: Precomputed embedding of text (e.g. from a batched call)
     """
-    # First sync the DB with the file
-    sync_chromadb_with_file(project_name)
+    # Let a sync queued by a recent write land so the query sees that write
+    _wait_for_sync(project_name)
+    # Only a stat when the file is unchanged; an edit made outside the app
+    # bumps the notes generation
+    read_notes_file(project_name)
+    index = SECTION_INDEXES.get(project_name)
+    if index is None or index.generation != NOTES_GENERATION[project_name]:
+        # Never indexed yet, or stale (writes re-sync the index themselves)
+        sync_section_index(project_name)
+        index = SECTION_INDEXES[project_name]
+    
+    # Repeated text against the same index resolves to the same section
+    cache_key = (project_name, index.generation, text)
+    with _section_cache_lock:
+        cached = _section_cache.get(cache_key)
+        if cached is not None:
+            _section_cache.move_to_end(cache_key)
+    if cached is not None:
+        log_event(logging.DEBUG, "similarity_cache_hit", project=project_name)
+        return cached
     
     try:
-        collection = get_collection(project_name)
-        results = collection.query(
-            query_embeddings=[get_embedding(text)],
-            n_results=1,
-            include=["documents", "metadatas", "distances"]
-        )
+        if query_embedding is None:
+            query_embedding = get_embedding(text)
+        best = _best_section(index, query_embedding)
     except Exception as e:
-        log_event(logging.ERROR, "chroma_query_error", project=project_name, error=str(e))
+        log_event(logging.ERROR, "section_search_error", project=project_name, error=str(e))
         return None, None, 0
     
-    if results['documents'] and results['documents'][0]:
-        distance = results['distances'][0][0]
-        similarity = 1 - distance  # Convert distance to similarity
-        
-        section_id = results['ids'][0][0]
-        heading = results['metadatas'][0][0].get('heading', '')
+    if best is not None:
+        section_id, heading, similarity = best
         log_event(
             logging.INFO,
             "similarity_match",
@@ -135,7 +473,13 @@ def find_relevant_section(text: str, project_name: str) -> Tuple[Optional[str],
             heading=heading,
             section_id=section_id,
         )
-        return section_id, heading, similarity
+        match = (section_id, heading, similarity)
+    else:
+        log_event(logging.INFO, "similarity_no_match", project=project_name)
+        match = (None, None, 0)
     
-    log_event(logging.INFO, "similarity_no_match", project=project_name)
-    return None, None, 0
+    with _section_cache_lock:
+        _section_cache[cache_key] = match
+        while len(_section_cache) > SECTION_CACHE_SIZE:
+            _section_cache.popitem(last=False)
+    return match
@@ -3,36 +3,71 @@ Application state management.
 Per-project state for transcript logs, pending updates, SSE clients, etc.
 """
 
-from collections import defaultdict
-from queue import Queue
+from collections import OrderedDict, defaultdict, deque
+from itertools import islice
+from queue import SimpleQueue
 from threading import Lock
-from typing import Dict, List
+from typing import Any, Deque, Dict, List, Set
 
-from models import PendingUpdate
+from models import ClientChannel, PendingUpdate, SectionIndex
 
 # --- STATE CONTAINERS ---
 
-# Transcript logs per project
-TRANSCRIPT_LOGS: Dict[str, List[Dict]] = defaultdict(list)
+# Per-project bounds for the rolling logs below
+TRANSCRIPT_LOG_SIZE: int = 20
+CONTEXT_HISTORY_SIZE: int = 5
 
-# Pending updates awaiting user confirmation
-PENDING_UPDATES: Dict[str, List[PendingUpdate]] = defaultdict(list)
+# Transcript logs per project (last TRANSCRIPT_LOG_SIZE entries)
+TRANSCRIPT_LOGS: Dict[str, Deque[Dict[str, Any]]] = defaultdict(lambda: deque(maxlen=TRANSCRIPT_LOG_SIZE))
+
+# Pending updates awaiting user confirmation, indexed by pending ID (insertion-ordered)
+PENDING_UPDATES: Dict[str, Dict[str, PendingUpdate]] = defaultdict(dict)
+
+# Guards every mutation (and iteration) of PENDING_UPDATES
+PENDING_LOCK = Lock()
 
 # Connected SSE clients per project
-CONNECTED_CLIENTS: Dict[str, List] = defaultdict(list)
+CONNECTED_CLIENTS: Dict[str, Set[ClientChannel]] = defaultdict(set)
+
+# Guards registration/removal of SSE clients and broadcast snapshots
+CLIENTS_LOCK = Lock()
+
+# In-memory section index per project
+SECTION_INDEXES: Dict[str, SectionIndex] = {}
+
+# Rolling context history per project (last CONTEXT_HISTORY_SIZE transcript chunks)
+CONTEXT_HISTORY: Dict[str, Deque[str]] = defaultdict(lambda: deque(maxlen=CONTEXT_HISTORY_SIZE))
 
-# Cached ChromaDB collections per project
-CHROMA_COLLECTIONS: Dict[str, object] = {}
+# Serializes each project's read-modify-write of its notes, so concurrent
+# transcripts (queue lanes, direct requests, pending resolutions) can't
+# overwrite each other's changes
+NOTES_LOCKS: Dict[str, Lock] = defaultdict(Lock)
 
-# Rolling context history per project (last N transcript chunks)
-CONTEXT_HISTORY: Dict[str, List[str]] = defaultdict(list)
+# Notes generation per project, bumped on every write (invalidates memoized lookups)
+NOTES_GENERATION: Dict[str, int] = defaultdict(int)
 
 # --- PROCESSING QUEUE ---
 # FIFO queue for transcript processing to ensure order is maintained
-PROCESSING_QUEUE: Queue = Queue()
+# (single consumer, so no task_done/join bookkeeping is needed)
+PROCESSING_QUEUE: SimpleQueue[Any] = SimpleQueue()
+
+# Processing results by request ID, striped across shards so requests with
+# different IDs don't serialize on one lock (each shard insertion-ordered)
+PROCESSING_SHARDS: int = 16
+
+PROCESSING_RESULTS_SHARDS: List["OrderedDict[str, Dict[str, Any]]"] = [
+    OrderedDict() for _ in range(PROCESSING_SHARDS)
+]
+
+# One lock per results shard for thread-safe operations
+PROCESSING_LOCKS: List[Lock] = [Lock() for _ in range(PROCESSING_SHARDS)]
+
+
+def processing_shard(request_id: str) -> int:
+    """Index of the results shard (and lock) owning a request ID."""
+    return hash(request_id) & (PROCESSING_SHARDS - 1)
 
-# Lock for thread-safe operations
-PROCESSING_LOCK: Lock = Lock()
 
-# Track processing results by request ID
-PROCESSING_RESULTS: Dict[str, Dict] = {}
+def recent_entries(log: Deque[Any], count: int) -> List[Any]:
+    """Last count entries of a rolling log, oldest first (without copying the rest)."""
+    return list(islice(log, max(len(log) - count, 0), None))
@@ -16,14 +16,20 @@ function connectSSE() {
             const data = JSON.parse(event.data);
             
             if (data.type === 'init') {
+                clearDraft();
                 markdownContent = data.content;
                 pendingUpdates = data.pending || [];
                 renderMarkdown();
                 renderPending();
                 renderTranscript(data.transcript);
+            } else if (data.type === 'partial') {
+                handlePartial(data);
             } else if (data.type === 'file_updated') {
                 handleFileUpdated(data);
+            } else if (data.type === 'update_failed') {
+                clearDraft();
             } else if (data.type === 'pending_update') {
+                clearDraft();
                 pendingUpdates.push(data.pending);
                 renderPending();
             } else if (data.type === 'pending_resolved') {
@@ -41,7 +47,24 @@ function connectSSE() {
     };
 }
 
+function handlePartial(data) {
+    // Show the draft in its own preview above the notes (whichever view is
+    // active) as it streams; for updates it's only the target section. The
+    // notes themselves wait for the final file_updated so the glow animation
+    // runs once
+    streamingDraft += data.delta;
+    draftPreviewEl.textContent = streamingDraft;
+    draftPreviewEl.classList.remove('hidden');
+}
+
+function clearDraft() {
+    streamingDraft = '';
+    draftPreviewEl.textContent = '';
+    draftPreviewEl.classList.add('hidden');
+}
+
 function handleFileUpdated(data) {
+    clearDraft();
     const oldContent = markdownContent;
     const newContent = data.content;
     
@@ -107,13 +130,16 @@ async function processTextInput(text) {
         const result = await response.json();
         
         if (result.status === 'pending') {
+            clearDraft();
             updateTranscriptItem(transcriptId, text, 'pending', result.reason);
         } else if (result.status === 'success') {
             updateTranscriptItem(transcriptId, text, 'success', result.action);
         } else {
+            clearDraft();
             updateTranscriptItem(transcriptId, text, 'error', result.error || 'Unknown error');
         }
     } catch (err) {
+        clearDraft();
         updateTranscriptItem(transcriptId, text, 'error', 'Failed to process');
     }
 }
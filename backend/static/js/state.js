@@ -16,6 +16,7 @@ let chunkInterval = null;
 let chunkCounter = 0;
 let processingChunks = new Set();
 let evtSource = null;
+let streamingDraft = ''; // Gemini output streamed so far for the in-flight update
 
 // --- CONSTANTS ---
 const CHUNK_DURATION = 10000; // 10 seconds
@@ -28,6 +29,7 @@ const textInput = document.getElementById('text-input');
 const transcriptContainer = document.getElementById('transcript-container');
 const markdownContentEl = document.getElementById('markdown-content');
 const rawContentEl = document.getElementById('raw-content');
+const draftPreviewEl = document.getElementById('draft-preview');
 const renderedView = document.getElementById('rendered-view');
 const rawView = document.getElementById('raw-view');
 const pendingSection = document.getElementById('pending-section');